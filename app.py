@@ -1,36 +1,238 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import openpyxl
 import xlsxwriter
 import io
+import datetime
+import re
+import warnings
+
+# With copy-on-write, validate_and_fix_data's assign shares the untouched columns with the
+# input frame instead of copying them. pandas 3 always behaves this way and deprecates the option.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+ISO_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?)?')
+
+# Date-like fields are recognised by name:
+# (parse format, Excel number format, precision kept, description used in errors)
+DATE_FIELD = ('%d-%m-%Y', 'dd-mm-yyyy', 'D', 'a date')
+DATETIME_FIELD = ('%d-%m-%Y %H:%M', 'dd-mm-yyyy hh:mm', 'min', 'a datetime')
+
+def _date_field_spec(field_name):
+    name = str(field_name).lower()
+    if 'date' in name and 'time' not in name:
+        return DATE_FIELD
+    if 'time' in name:
+        return DATETIME_FIELD
+    return None
+
+def _to_naive_datetime(values, fmt=None, dayfirst=False):
+    # UTC offsets are dropped rather than converted, so every value keeps the wall time (and
+    # therefore the date) it was written with
+    if values.dtype == object:
+        values = np.array([value.replace(tzinfo=None) if isinstance(value, datetime.datetime) and value.tzinfo else value
+                           for value in values], dtype=object)
+    try:
+        with warnings.catch_warnings():
+            # pandas 2 warns about mixed offsets and returns an object Index; pandas 3 raises
+            warnings.simplefilter('ignore', FutureWarning)
+            parsed = pd.to_datetime(values, format=fmt, dayfirst=dayfirst, errors='coerce')
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, pd.DatetimeIndex):
+        # Strings carrying different offsets: parse them one at a time
+        parsed = pd.DatetimeIndex([pd.to_datetime([value], format=fmt, dayfirst=dayfirst, errors='coerce')[0].tz_localize(None)
+                                   for value in values])
+    return parsed.tz_localize(None) if parsed.tz is not None else parsed
+
+def _vectorized_to_datetime(series, fmt=None):
+    # Annexure columns repeat the same dates heavily, so parse each distinct value once
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0:
+        return pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    if fmt is not None:
+        parsed = _to_naive_datetime(uniques, fmt)
+    else:
+        # ISO values go to pandas' dedicated ISO parser, which accepts date-only and date-time
+        # values in one column. Inference would pick one format from the first value and reject
+        # every value written differently, so the rest use 'mixed' to parse dd-mm-yyyy and
+        # dd-mm-yyyy hh:mm leftovers in the same pass. They are kept apart because pandas 3
+        # applies dayfirst to ISO strings too.
+        values = np.asarray(uniques, dtype=object)
+        is_iso = np.array([isinstance(value, str) and ISO_DATE_PATTERN.fullmatch(value) is not None
+                           for value in values], dtype=bool)
+        result = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ns]')
+        if is_iso.any():
+            result[is_iso] = _to_naive_datetime(values[is_iso], 'ISO8601').as_unit('ns').to_numpy()
+        if not is_iso.all():
+            result[~is_iso] = _to_naive_datetime(values[~is_iso], 'mixed', dayfirst=True).as_unit('ns').to_numpy()
+        parsed = pd.DatetimeIndex(result)
+    return pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=series.index)
+
+def _sample_matches_format(series, fmt, size=100):
+    sample = series.dropna().head(size)
+    return _to_naive_datetime(sample.to_numpy(), fmt).notna().any()
+
+def _serials_to_datetime(serials):
+    # Numbers in a date field are Excel serial days. Casting to int64/float64 first keeps
+    # to_datetime on its C path; other integer widths fall back to per-element conversion.
+    # Excel serials only run from 1900-01-00 to 9999-12-31; anything outside is not a date
+    in_range = serials.between(0, 2958465)
+    if serials.dtype.kind in 'iu' and in_range.all():
+        serials = serials.astype('int64')
+    else:
+        serials = serials.astype('float64').where(in_range)
+    return pd.to_datetime(serials, unit='D', origin='1899-12-30', errors='coerce')
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+def _fix_date_column(column_data, expected_format, precision):
+    # Returns the column as datetime64 (formatted only when written to Excel) and
+    # whether any value could not be parsed at all.
+    if pd.api.types.is_numeric_dtype(column_data) and not pd.api.types.is_bool_dtype(column_data):
+        parsed = _serials_to_datetime(column_data)
+        return parsed.dt.floor(precision), (parsed.isna() & column_data.notna()).any()
+    
+    # Unformatted date cells mixed in with text or date cells arrive as plain numbers in an
+    # object column; convert those as serials and keep them out of the text parse
+    serials = None
+    if column_data.dtype == object and pd.api.types.infer_dtype(column_data, skipna=True) != 'string':
+        is_serial = column_data.map(_is_number) & column_data.notna()
+        if is_serial.any():
+            serials = _serials_to_datetime(column_data[is_serial])
+            column_data = column_data.mask(is_serial)
+    
+    # Parse with the known format first so pandas stays on its C strptime path,
+    # and only fall back to a mixed-format parse for the rows that did not match.
+    # A column whose sample never matches is sent straight to the fallback.
+    if _sample_matches_format(column_data, expected_format):
+        parsed = _vectorized_to_datetime(column_data, expected_format)
+    else:
+        parsed = pd.Series(pd.NaT, index=column_data.index, dtype='datetime64[ns]')
+    unparsed = parsed.isna() & column_data.notna()
+    
+    has_bad_values = False
+    if unparsed.any():
+        parsed = parsed.fillna(_vectorized_to_datetime(column_data[unparsed]))
+        has_bad_values = (parsed.isna() & column_data.notna()).any()
+    if serials is not None:
+        parsed = parsed.fillna(serials)
+        has_bad_values = has_bad_values or serials.isna().any()
+    # Drop whatever the expected format does not show, e.g. the time of day on date fields
+    return parsed.dt.floor(precision), has_bad_values
 
 def validate_and_fix_data(input_df, validation_rules, state_master):
     errors = []
-    modified_df = input_df.copy()
+    changes = {}
     
-    for index, row in validation_rules.iterrows():
-        field_name = row[1]  # 2nd column is field name
-        data_type = row[2]   # 3rd column is data type
-        mandatory = row[4]   # 5th column is Mandatory (M) or Optional (O)
-        
+    field_names = validation_rules.iloc[:, 1].to_numpy()  # 2nd column is field name
+    
+    for field_name in field_names:
         if field_name in input_df.columns:
+            date_spec = _date_field_spec(field_name)
+            if date_spec is None:
+                continue
+            
+            expected_format, _, precision, expected_kind = date_spec
             column_data = input_df[field_name]
+            if pd.api.types.is_datetime64_any_dtype(column_data):
+                # Columns calamine already read as dates need no parsing, only the same
+                # precision as parsed text (and their wall time if they carry a zone)
+                if column_data.dt.tz is not None:
+                    column_data = column_data.dt.tz_localize(None)
+                changes[field_name] = column_data.dt.floor(precision)
+                continue
             
-            if 'date' in field_name.lower() and 'time' not in field_name.lower():
-                expected_format = '%d-%m-%Y'
-                try:
-                    modified_df[field_name] = pd.to_datetime(column_data, errors='coerce').dt.strftime(expected_format)
-                except:
-                    errors.append(f"Field '{field_name}' should be a date.")
-            elif 'time' in field_name.lower():
-                expected_format = '%d-%m-%Y %H:%M'
-                try:
-                    modified_df[field_name] = pd.to_datetime(column_data, errors='coerce').dt.strftime(expected_format)
-                except:
-                    errors.append(f"Field '{field_name}' should be a datetime.")
+            fixed_column, has_bad_values = _fix_date_column(column_data, expected_format, precision)
+            if has_bad_values:
+                errors.append(f"Field '{field_name}' should be {expected_kind}.")
+            changes[field_name] = fixed_column
+    
+    # Only build a new frame when some column actually had to be fixed
+    return (input_df.assign(**changes) if changes else input_df), errors
+
+def _excel_cell(value, type_formats):
+    # Same conversions pandas' ExcelWriter applies before handing a value to the engine
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        value = value.item()
+    if isinstance(value, (bool, int, float, str)):
+        return value, None
+    if isinstance(value, datetime.datetime):
+        return value, type_formats['datetime']
+    if isinstance(value, datetime.date):
+        return value, type_formats['date']
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds() / 86400, type_formats['timedelta']
+    return str(value), None
+
+def to_excel_bytes(df, column_formats=None, sheet_name='Validated_Data'):
+    output = io.BytesIO()
+    # Rows are written strictly in order, so constant_memory can flush each one as soon as it
+    # is done; Excel has no time zones, so aware timestamps are written as their wall time;
+    # cell text is written as-is instead of being sniffed for formulas, URLs or numbers
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'remove_timezone': True,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+        'strings_to_numbers': False,
+    })
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    # Each number format is registered once and reused for every cell that needs it
+    type_formats = {
+        'datetime': workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'}),
+        'date': workbook.add_format({'num_format': 'yyyy-mm-dd'}),
+        'timedelta': workbook.add_format({'num_format': '0'}),
+    }
+    column_formats = column_formats or {}
+    cell_formats = [workbook.add_format({'num_format': column_formats[column]}) if column in column_formats else None
+                    for column in df.columns]
+    
+    worksheet.write_row(0, 0, df.columns.tolist(), header_format)
+    for row_number, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        for col_number, (value, cell_format) in enumerate(zip(row, cell_formats)):
+            if not pd.isna(value):
+                value, value_format = _excel_cell(value, type_formats)
+                worksheet.write(row_number, col_number, value, cell_format or value_format)
+    
+    workbook.close()
+    return output.getvalue()
+
+# Streamlit reruns the whole script on every widget event, so parsing, validation and the
+# output workbook are cached on the uploaded file contents and only redone when a file or
+# sheet changes
+@st.cache_data(show_spinner=False)
+def load_sheet_names(file_bytes):
+    return pd.ExcelFile(io.BytesIO(file_bytes), engine='calamine').sheet_names
+
+@st.cache_data(show_spinner=False)
+def load_and_validate(validation_bytes, input_bytes, validation_sheet, state_master_sheet):
+    validation_xl = pd.ExcelFile(io.BytesIO(validation_bytes), engine='calamine')
+    input_xl = pd.ExcelFile(io.BytesIO(input_bytes), engine='calamine')
+    
+    validation_rules = validation_xl.parse(validation_sheet).iloc[:, :6]
+    state_master = validation_xl.parse(state_master_sheet).iloc[:, 0]
+    
+    # Read text fields from the master as Arrow-backed strings so codes keep their leading
+    # zeros and string operations on them run in Arrow kernels
+    data_types = validation_rules.iloc[:, 2].astype(str).str.strip().str.lower()
+    string_fields = validation_rules.iloc[:, 1][data_types.isin(['string', 'text'])]
+    input_df = input_xl.parse(input_xl.sheet_names[0], dtype={field: 'string[pyarrow]' for field in string_fields})
+    
+    modified_df, errors = validate_and_fix_data(input_df, validation_rules, state_master)
     
-    return modified_df, errors
+    # Fixed date fields stay datetime64 and are only formatted as cells when written. The
+    # workbook is built here so the cell-by-cell write is also cached rather than rerun
+    date_formats = {}
+    for column in modified_df.columns:
+        date_spec = _date_field_spec(column)
+        if date_spec and pd.api.types.is_datetime64_any_dtype(modified_df[column]):
+            date_formats[column] = date_spec[1]
+    output_bytes = to_excel_bytes(modified_df, date_formats)
+    return input_df, modified_df, errors, output_bytes
 
 def main():
     st.title("Excel Validation & Fixing Tool")
@@ -39,37 +241,38 @@ def main():
     input_file = st.file_uploader("Upload Input Excel", type=['xlsx'])
     
     if validation_file and input_file:
-        validation_xl = pd.ExcelFile(validation_file)
-        input_xl = pd.ExcelFile(input_file)
+        validation_bytes = validation_file.getvalue()
+        input_bytes = input_file.getvalue()
         
-        sheet_options = validation_xl.sheet_names
+        sheet_options = load_sheet_names(validation_bytes)
         validation_sheet = st.selectbox("Select Validation Sheet", sheet_options)
         state_master_sheet = st.selectbox("Select State Master Sheet", sheet_options)
         
-        validation_rules = validation_xl.parse(validation_sheet).iloc[:, :6]
-        state_master = validation_xl.parse(state_master_sheet).iloc[:, 0]
-        input_df = input_xl.parse(input_xl.sheet_names[0])
-        
-        modified_df, errors = validate_and_fix_data(input_df, validation_rules, state_master)
+        input_df, modified_df, errors, output_bytes = load_and_validate(validation_bytes, input_bytes, validation_sheet, state_master_sheet)
         
         for error in errors:
-            col_name = error.split("'")[1]
             st.error(error)
-            if st.button(f"Fix '{col_name}'"):
-                original_data = input_df[col_name].astype(str).head(5)
-                modified_data = modified_df[col_name].astype(str).head(5)
+        
+        # One button previews every flagged column, so reviewing fixes costs a single rerun
+        error_columns = list(dict.fromkeys(error.split("'")[1] for error in errors))
+        if error_columns and st.button("Preview All Fixes"):
+            for col_name in error_columns:
+                original_data = input_df[col_name].head(5).astype(str)
+                modified_data = modified_df[col_name].head(5)
+                # Show fixed dates the way they will be formatted in the downloaded file
+                date_spec = _date_field_spec(col_name)
+                if date_spec and pd.api.types.is_datetime64_any_dtype(modified_data):
+                    modified_data = modified_data.dt.strftime(date_spec[0])
+                else:
+                    modified_data = modified_data.astype(str)
                 
-                st.write("### Before Fixing:")
+                st.write(f"### '{col_name}' Before Fixing:")
                 st.dataframe(original_data)
                 
-                st.write("### After Fixing:")
+                st.write(f"### '{col_name}' After Fixing:")
                 st.dataframe(modified_data)
         
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            modified_df.to_excel(writer, index=False, sheet_name='Validated_Data')
-        
-        st.download_button("Download Modified Excel", data=output.getvalue(), file_name="validated_data.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        st.download_button("Download Modified Excel", data=output_bytes, file_name="validated_data.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
         
 if __name__ == "__main__":
     main()
@@ -0,0 +1,102 @@
+import datetime
+import io
+
+import openpyxl
+import pandas as pd
+
+from app import to_excel_bytes, validate_and_fix_data
+
+RULES = pd.DataFrame({
+    'Sr No': [1],
+    'Field Name': ['Posting Date'],
+    'Data Type': ['date'],
+    'Length': [None],
+    'Mandatory': ['O'],
+    'Remarks': [None],
+})
+
+
+def test_mixed_utc_offsets_do_not_crash_validation():
+    input_df = pd.DataFrame({'Posting Date': ['2024-01-05T10:00:00+05:30', '2024-01-06T10:00:00Z', 'junk']})
+
+    modified_df, errors = validate_and_fix_data(input_df, RULES, None)
+
+    assert errors == ["Field 'Posting Date' should be a date."]
+    assert modified_df['Posting Date'].dt.tz is None
+    assert modified_df['Posting Date'].tolist()[:2] == [pd.Timestamp('2024-01-05'), pd.Timestamp('2024-01-06')]
+    assert to_excel_bytes(modified_df, {'Posting Date': 'dd-mm-yyyy'})
+
+
+def test_utc_offsets_are_dropped_without_shifting_the_wall_time():
+    rules = pd.DataFrame({
+        'Sr No': [1, 2],
+        'Field Name': ['Posting Date', 'Entry Time'],
+        'Data Type': ['date', 'datetime'],
+        'Length': [None, None],
+        'Mandatory': ['O', 'O'],
+        'Remarks': [None, None],
+    })
+    input_df = pd.DataFrame({
+        'Posting Date': pd.Series(['2024-01-05T02:00:00+05:30', pd.Timestamp('2024-01-06 01:00', tz='Asia/Kolkata'), '07-01-2024'], dtype=object),
+        'Entry Time': ['2024-01-05T02:00:00+05:30', '2024-01-06T03:15:00Z', '07-01-2024 04:30'],
+    })
+
+    modified_df, errors = validate_and_fix_data(input_df, rules, None)
+
+    assert errors == []
+    assert modified_df['Posting Date'].tolist() == [pd.Timestamp('2024-01-05'), pd.Timestamp('2024-01-06'), pd.Timestamp('2024-01-07')]
+    assert modified_df['Entry Time'].tolist() == [
+        pd.Timestamp('2024-01-05 02:00'), pd.Timestamp('2024-01-06 03:15'), pd.Timestamp('2024-01-07 04:30'),
+    ]
+
+
+def test_numeric_serials_among_text_dates_are_read_as_excel_days():
+    input_df = pd.DataFrame({'Posting Date': pd.Series(['05-01-2024', 45300, 10 ** 12], dtype=object)})
+
+    modified_df, errors = validate_and_fix_data(input_df, RULES, None)
+
+    assert errors == ["Field 'Posting Date' should be a date."]
+    assert modified_df['Posting Date'].tolist()[:2] == [pd.Timestamp('2024-01-05'), pd.Timestamp('2024-01-09')]
+
+
+def test_datetime_cells_in_a_date_field_are_floored_like_parsed_text():
+    input_df = pd.DataFrame({'Posting Date': pd.to_datetime(['2024-01-05 10:00', None])})
+
+    modified_df, errors = validate_and_fix_data(input_df, RULES, None)
+
+    assert errors == []
+    assert modified_df['Posting Date'].iloc[0] == pd.Timestamp('2024-01-05')
+    assert pd.isna(modified_df['Posting Date'].iloc[1])
+
+
+def test_to_excel_bytes_round_trips_values_and_number_formats():
+    df = pd.DataFrame({
+        'Sr No': [1, 2],
+        'Posting Date': pd.to_datetime(['2024-01-05', None]),
+        'Slot': [datetime.time(10, 30), None],
+        'Duration': [pd.Timedelta(hours=3), pd.NaT],
+        'Amount': [1.5, float('nan')],
+        'Code': pd.Series(['=1+1', pd.NA], dtype='string'),
+        'Pin': ['007', None],
+        'Logged': pd.to_datetime(['2024-01-05 10:00', None]).tz_localize('Asia/Kolkata'),
+    })
+
+    workbook = openpyxl.load_workbook(io.BytesIO(to_excel_bytes(df, {'Posting Date': 'dd-mm-yyyy'})))
+    sheet = workbook['Validated_Data']
+    rows = [[(cell.value, cell.number_format) for cell in row] for row in sheet.iter_rows()]
+
+    assert [value for value, _ in rows[0]] == df.columns.tolist()
+    assert rows[1] == [
+        (1, 'General'),
+        (datetime.datetime(2024, 1, 5), 'dd-mm-yyyy'),
+        ('10:30:00', 'General'),
+        (0.125, '0'),
+        (1.5, 'General'),
+        ('=1+1', 'General'),
+        ('007', 'General'),
+        (datetime.datetime(2024, 1, 5, 10, 0), 'yyyy-mm-dd hh:mm:ss'),
+    ]
+    # '=1+1' and '007' stay text rather than becoming a formula or a number
+    assert sheet['F2'].data_type == 's' and sheet['G2'].data_type == 's'
+    # NaN, NaT and pd.NA are left as blank cells
+    assert [value for value, _ in rows[2]] == [2] + [None] * (len(df.columns) - 1)